@@ -1,24 +1,45 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import io
+import hashlib
+import math
+import os
+import threading
+import uuid
+from bisect import bisect_left, insort
+from numba import njit
+
+# Whole-point rating gaps in [-2000, 2000] have precomputed expected scores
+_EXPECTED_OFFSET = 2000
+
+# ELO K factor, the rating every new player starts at, and the constant that turns
+# a rating gap into a base-2 exponent
+K_FACTOR = 32
+STARTING_RATING = 1400
+_LOG2_10_OVER_400 = math.log2(10.0) / 400.0
 
 # ELO calculation functions
 def calculate_expected_score(rating_a, rating_b):
     """Calculate expected score for team A against team B"""
-    return 1 / (1 + 10**((rating_b - rating_a) / 400))
+    diff = rating_b - rating_a
+    if diff == int(diff) and -_EXPECTED_OFFSET <= diff <= _EXPECTED_OFFSET:
+        return float(_EXPECTED_LUT[int(diff) + _EXPECTED_OFFSET])
+    return 1.0 / (1.0 + math.pow(10.0, diff / 400.0))
 
 def calculate_team_rating(player_ratings):
     """Calculate average team rating from individual player ratings"""
-    return sum(player_ratings) / len(player_ratings)
+    return np.mean(player_ratings)
 
-def update_elo_ratings(team_a_ratings, team_b_ratings, team_a_wins, k=32):
+def update_elo_ratings(team_a_ratings, team_b_ratings, team_a_wins, k=K_FACTOR):
     """
     Update ELO ratings based on team match result
     team_a_ratings: list of ratings for team A players
     team_b_ratings: list of ratings for team B players
     team_a_wins: True if team A wins, False if team B wins
     """
+    team_a_ratings = np.asarray(team_a_ratings, dtype=np.float64)
+    team_b_ratings = np.asarray(team_b_ratings, dtype=np.float64)
+    
     # Calculate team averages
     avg_rating_a = calculate_team_rating(team_a_ratings)
     avg_rating_b = calculate_team_rating(team_b_ratings)
@@ -32,9 +53,10 @@ def update_elo_ratings(team_a_ratings, team_b_ratings, team_a_wins, k=32):
     # Calculate rating change
     rating_change = k * (score_a - expected_a)
     
-    # Apply change to all players
-    new_ratings_a = [round(rating + rating_change) for rating in team_a_ratings]
-    new_ratings_b = [round(rating - rating_change) for rating in team_b_ratings]
+    # Apply the same change to every player on a team in one vectorized step
+    # (np.rint rounds half to even, like round)
+    new_ratings_a = np.rint(team_a_ratings + rating_change).astype(np.int64).tolist()
+    new_ratings_b = np.rint(team_b_ratings - rating_change).astype(np.int64).tolist()
     
     return new_ratings_a, new_ratings_b, round(rating_change)
 
@@ -42,11 +64,492 @@ def parse_team_string(team_str):
     """Parse team string like 'Alice,Bob,Charlie' into list of players"""
     return [player.strip() for player in team_str.split(',') if player.strip()]
 
+def record_player_stats(player_stats, team_a_players, team_b_players, team_a_wins):
+    """Add one match to the running matches/wins counters of every player in it"""
+    winners = set(team_a_players) if team_a_wins else set(team_b_players)
+    for player in set(team_a_players) | set(team_b_players):
+        stats = player_stats.setdefault(player, {'matches': 0, 'wins': 0})
+        stats['matches'] += 1
+        stats['wins'] += player in winners
+
+def split_team_column(team_col):
+    """
+    Vectorized parse_team_string over a column of team strings
+    Returns (flat array of player names in match order, array of team sizes per match)
+    """
+    players = pd.Series(team_col, dtype=object).str.split(',').explode().str.strip()
+    players = players[players.str.len() > 0]
+    sizes = players.groupby(level=0).size().reindex(range(len(team_col)), fill_value=0)
+    return players.to_numpy(dtype=object), sizes.to_numpy(dtype=np.int64)
+
+def record_batch_player_stats(player_stats, a_names, a_sizes, b_names, b_sizes, team_a_wins):
+    """
+    Add a batch of matches to the per-player matches/wins counters with grouped counts
+    a_names/b_names: flat player names of every team, a_sizes/b_sizes: team sizes per match
+    team_a_wins: boolean array, one entry per match
+    """
+    a_match = np.repeat(np.arange(len(a_sizes)), a_sizes)
+    b_match = np.repeat(np.arange(len(b_sizes)), b_sizes)
+    appearances = pd.DataFrame({
+        'match': np.concatenate([a_match, b_match]),
+        'player': np.concatenate([a_names, b_names]),
+        'won': np.concatenate([team_a_wins[a_match], ~team_a_wins[b_match]])
+    })
+    # A player counts once per match, and wins it if they were on the winning side
+    per_match = appearances.groupby(['match', 'player'], sort=False)['won'].any()
+    totals = per_match.groupby(level='player', sort=False).agg(['size', 'sum'])
+    for player, matches, wins in totals.itertuples():
+        stats = player_stats.setdefault(player, {'matches': 0, 'wins': 0})
+        stats['matches'] += int(matches)
+        stats['wins'] += int(wins)
+
+def build_player_stats(history):
+    """Count matches and wins for every player with vectorized parsing of the match history"""
+    player_stats = {}
+    a_names, a_sizes = split_team_column(history['Team_A'].to_numpy(dtype=object))
+    b_names, b_sizes = split_team_column(history['Team_B'].to_numpy(dtype=object))
+    team_a_wins = (history['Winner'] == 'Team_A').to_numpy(dtype=bool)
+    record_batch_player_stats(player_stats, a_names, a_sizes, b_names, b_sizes, team_a_wins)
+    return player_stats
+
+@st.cache_resource
+def load_elo_kernels():
+    """
+    Build the expected-score table and compile the replay kernel once per process,
+    so reruns and new sessions reuse them instead of rebuilding on every script run
+    Returns (expected-score lookup table, compiled replay kernel)
+    """
+    # Built with math.pow so lookups match the direct formula exactly
+    expected_lut = np.array([
+        1.0 / (1.0 + math.pow(10.0, diff / 400.0))
+        for diff in range(-_EXPECTED_OFFSET, _EXPECTED_OFFSET + 1)
+    ])
+    
+    @njit(fastmath=True, cache=True)
+    def replay_elo(a_flat, a_off, b_flat, b_off, score_a, ratings, expected_lut):
+        """
+        Sequential ELO replay over teams stored as flat index arrays, specialized for K_FACTOR
+        a_flat/b_flat: player indices of every team, concatenated in match order
+        a_off/b_off: offsets of each match's team into a_flat/b_flat (length matches + 1)
+        score_a: 1.0 if team A won the match, 0.0 otherwise
+        ratings: ratings indexed by player, updated in place
+        expected_lut: expected scores for whole-point rating gaps, indexed by gap + _EXPECTED_OFFSET
+        Returns the unrounded rating change for team A in every match
+        """
+        n_matches = score_a.shape[0]
+        changes = np.empty(n_matches, dtype=np.float64)
+        max_size = 1
+        for i in range(n_matches):
+            max_size = max(max_size, a_off[i + 1] - a_off[i], b_off[i + 1] - b_off[i])
+        new_a = np.empty(max_size, dtype=np.float64)
+        new_b = np.empty(max_size, dtype=np.float64)
+        
+        for i in range(n_matches):
+            a0, a1 = a_off[i], a_off[i + 1]
+            b0, b1 = b_off[i], b_off[i + 1]
+            
+            # Calculate team averages
+            sum_a = 0.0
+            for j in range(a0, a1):
+                sum_a += ratings[a_flat[j]]
+            sum_b = 0.0
+            for j in range(b0, b1):
+                sum_b += ratings[b_flat[j]]
+            avg_rating_a = sum_a / (a1 - a0)
+            avg_rating_b = sum_b / (b1 - b0)
+            
+            gap = avg_rating_b - avg_rating_a
+            if gap == np.floor(gap) and abs(gap) <= _EXPECTED_OFFSET:
+                expected_a = expected_lut[int(gap) + _EXPECTED_OFFSET]
+            else:
+                expected_a = 1.0 / (1.0 + np.exp2(gap * _LOG2_10_OVER_400))
+            change = K_FACTOR * (score_a[i] - expected_a)
+            
+            # New ratings are computed from the pre-match ratings before any are written
+            for j in range(a0, a1):
+                new_a[j - a0] = np.rint(ratings[a_flat[j]] + change)
+            for j in range(b0, b1):
+                new_b[j - b0] = np.rint(ratings[b_flat[j]] - change)
+            for j in range(a0, a1):
+                ratings[a_flat[j]] = new_a[j - a0]
+            for j in range(b0, b1):
+                ratings[b_flat[j]] = new_b[j - b0]
+            changes[i] = change
+        
+        return changes
+    
+    # Compile up front so the first upload doesn't pay for it
+    replay_elo(
+        np.zeros(1, dtype=np.int64), np.array([0, 1], dtype=np.int64),
+        np.zeros(1, dtype=np.int64), np.array([0, 1], dtype=np.int64),
+        np.ones(1, dtype=np.float64), np.full(1, 1400.0), expected_lut
+    )
+    
+    return expected_lut, replay_elo
+
+_EXPECTED_LUT, _replay_elo = load_elo_kernels()
+
+def set_player_ratings(players, ladder, new_ratings):
+    """
+    Apply new ratings and keep the ladder sorted without a full re-sort
+    players: dict of player -> rating
+    ladder: list of (-rating, player) tuples in ladder order
+    new_ratings: dict of player -> new rating
+    """
+    for player, rating in new_ratings.items():
+        old_rating = players.get(player)
+        if old_rating is not None:
+            del ladder[bisect_left(ladder, (-old_rating, player))]
+        insort(ladder, (-rating, player))
+        players[player] = rating
+
+# Match history is stored column-wise and persisted to disk between sessions
+MATCH_HISTORY_PATH = "matches.parquet"
+MATCH_HISTORY_DTYPES = {
+    'Team_A': 'string',
+    'Team_B': 'string',
+    'Winner': pd.CategoricalDtype(['Team_A', 'Team_B']),
+    'Team_A_Rating_Change': 'int16',
+    'Team_B_Rating_Change': 'int16',
+    # Parsed team sizes, stored at insert time so views never re-split the team strings
+    'Team_A_Size': 'int16',
+    'Team_B_Size': 'int16',
+}
+# Columns of the downloadable match history (the size columns are internal)
+MATCH_HISTORY_EXPORT_COLUMNS = ['Team_A', 'Team_B', 'Winner', 'Team_A_Rating_Change', 'Team_B_Rating_Change']
+
+def load_match_history():
+    """Load the saved match history, or an empty history if none exists"""
+    if os.path.exists(MATCH_HISTORY_PATH):
+        history = pd.read_parquet(MATCH_HISTORY_PATH)
+        return history[list(MATCH_HISTORY_DTYPES)].astype(MATCH_HISTORY_DTYPES)
+    return pd.DataFrame({col: pd.Series(dtype=dtype) for col, dtype in MATCH_HISTORY_DTYPES.items()})
+
+@st.cache_resource
+def history_lock():
+    """Process-wide lock shared by all sessions around read-modify-write of the saved files"""
+    return threading.Lock()
+
+def write_parquet_atomic(df, path):
+    """Write a DataFrame to Parquet via a temp file, so a failed write never leaves a partial file"""
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def history_from_records(records):
+    """Typed match history from a list of match dicts, the in-memory format used before the DataFrame history"""
+    history = pd.DataFrame(records, columns=MATCH_HISTORY_EXPORT_COLUMNS)
+    for team_col in ['Team_A', 'Team_B']:
+        history[f'{team_col}_Size'] = split_team_column(history[team_col].to_numpy(dtype=object))[1]
+    return history.astype(MATCH_HISTORY_DTYPES)
+
+def append_match_history(new_matches):
+    """
+    Append a batch of matches (a DataFrame with the history columns) to the saved history
+    The file is re-read under the lock, so matches saved by other sessions are kept
+    Returns (full history including the new matches, number of matches saved before them)
+    """
+    new_rows = new_matches[list(MATCH_HISTORY_DTYPES)].astype(MATCH_HISTORY_DTYPES)
+    with history_lock():
+        history = load_match_history()
+        n_saved = len(history)
+        history = pd.concat([history, new_rows], ignore_index=True) if n_saved else new_rows
+        write_parquet_atomic(history, MATCH_HISTORY_PATH)
+    return history, n_saved
+
+# Ratings and stats as of a known history length, so new sessions only replay newer matches
+RATINGS_SNAPSHOT_PATH = "ratings_snapshot.parquet"
+# Bump when the way ratings are computed from the history changes, so old snapshots are replayed
+RATING_RULES_VERSION = 1
+
+def rating_rules():
+    """The rating rules a snapshot was computed under, stored with it and checked on load"""
+    return {'rules_version': RATING_RULES_VERSION, 'k_factor': K_FACTOR, 'starting_rating': STARTING_RATING}
+
+def history_fingerprint(history):
+    """Hash of the history rows, used to check that a snapshot was taken from this history"""
+    row_hashes = pd.util.hash_pandas_object(history, index=False).to_numpy()
+    return hashlib.sha256(row_hashes.tobytes()).hexdigest()
+
+def save_ratings_snapshot(history, players, player_stats):
+    """Save the current ratings and matches/wins counters along with the history they cover"""
+    names = list(players)
+    snapshot = pd.DataFrame({
+        'Player': pd.Series(names, dtype='string'),
+        'Rating': np.fromiter((players[p] for p in names), dtype=np.int64, count=len(names)),
+        'Matches': np.fromiter((player_stats[p]['matches'] for p in names), dtype=np.int64, count=len(names)),
+        'Wins': np.fromiter((player_stats[p]['wins'] for p in names), dtype=np.int64, count=len(names))
+    })
+    snapshot.attrs = {
+        'history_rows': len(history),
+        'history_hash': history_fingerprint(history),
+        **rating_rules()
+    }
+    write_parquet_atomic(snapshot, RATINGS_SNAPSHOT_PATH)
+
+def load_ratings_snapshot(history):
+    """
+    Load the saved ratings snapshot if it was taken from a prefix of this history
+    Returns (players, player_stats, number of history rows covered), or None if there is no usable snapshot
+    """
+    if not os.path.exists(RATINGS_SNAPSHOT_PATH):
+        return None
+    try:
+        snapshot = pd.read_parquet(RATINGS_SNAPSHOT_PATH)
+    except Exception:
+        # The snapshot is only a cache; an unreadable file means a full replay
+        return None
+    # Ratings computed under different rules are not reused
+    if any(snapshot.attrs.get(key) != value for key, value in rating_rules().items()):
+        return None
+    n_rows = snapshot.attrs.get('history_rows')
+    if n_rows is None or n_rows > len(history):
+        return None
+    if snapshot.attrs.get('history_hash') != history_fingerprint(history.iloc[:n_rows]):
+        return None
+    
+    names = snapshot['Player'].tolist()
+    players = dict(zip(names, snapshot['Rating'].tolist()))
+    player_stats = {
+        player: {'matches': matches, 'wins': wins}
+        for player, matches, wins in zip(names, snapshot['Matches'].tolist(), snapshot['Wins'].tolist())
+    }
+    return players, player_stats, n_rows
+
+def rebuild_from_history(history):
+    """
+    Ratings and matches/wins counters for a history: the saved snapshot when it matches,
+    plus a replay of any newer matches (the snapshot is refreshed after a replay)
+    Returns (players, player_stats)
+    """
+    snapshot = load_ratings_snapshot(history)
+    players, player_stats, n_replayed = snapshot if snapshot else ({}, {}, 0)
+    pending = history.iloc[n_replayed:]
+    if len(pending):
+        _, new_ratings, _ = replay_matches(
+            pending['Team_A'].to_numpy(), pending['Team_B'].to_numpy(),
+            pending['Winner'].array, players, player_stats
+        )
+        players.update(new_ratings)
+        save_ratings_snapshot(history, players, player_stats)
+    return players, player_stats
+
+def session_working_copy():
+    """
+    Copies of this session's ratings, ladder and matches/wins counters to apply new matches to,
+    so the session itself only changes once the matches are saved
+    Returns (players, ladder, player_stats)
+    """
+    return (
+        dict(st.session_state.players),
+        list(st.session_state.ladder),
+        {player: dict(stats) for player, stats in st.session_state.player_stats.items()}
+    )
+
+def store_new_matches(new_matches, players, ladder, player_stats):
+    """
+    Save a batch of matches and make the session's working copy (with the matches applied) current
+    If saving fails the session keeps its previous state; if other sessions saved matches
+    in the meantime, ratings and stats are rebuilt from the merged history instead
+    """
+    n_before = len(st.session_state.match_history)
+    history, n_saved = append_match_history(new_matches)
+    st.session_state.match_history = history
+    if n_saved == n_before:
+        st.session_state.players = players
+        st.session_state.ladder = ladder
+        st.session_state.player_stats = player_stats
+        save_ratings_snapshot(history, players, player_stats)
+    else:
+        players, player_stats = rebuild_from_history(history)
+        st.session_state.players = players
+        st.session_state.player_stats = player_stats
+        st.session_state.ladder = sorted((-rating, player) for player, rating in players.items())
+
+def replay_matches(team_a_col, team_b_col, winner_col, players, player_stats):
+    """
+    Replay a batch of team matches in order and update ELO ratings
+    team_a_col/team_b_col: arrays of comma-separated player names
+    winner_col: 'Team_A'/'Team_B' values, as strings or a Categorical (validated by the caller)
+    players: dict of current ratings (new players start at STARTING_RATING)
+    player_stats: dict of per-player matches/wins counters, updated in place
+    Returns (DataFrame of processed matches, dict of new ratings, DataFrame of skipped matches)
+    """
+    team_a_col = np.asarray(team_a_col)
+    team_b_col = np.asarray(team_b_col)
+    # Category codes give the winning side without comparing strings (0 is Team_A)
+    winner_col = pd.Categorical(winner_col, dtype=MATCH_HISTORY_DTYPES['Winner'])
+    team_a_wins = winner_col.codes == 0
+    
+    # Parse all teams with vectorized string ops into flat name arrays plus team sizes
+    a_names, a_sizes = split_team_column(team_a_col)
+    b_names, b_sizes = split_team_column(team_b_col)
+    
+    # Drop matches with an empty side, along with their players in the flat arrays
+    valid = (a_sizes > 0) & (b_sizes > 0)
+    kept = np.flatnonzero(valid)
+    skipped = pd.DataFrame({
+        'Team_A': team_a_col[~valid],
+        'Team_B': team_b_col[~valid],
+        'Reason': 'Empty team'
+    })
+    a_names = a_names[np.repeat(valid, a_sizes)]
+    b_names = b_names[np.repeat(valid, b_sizes)]
+    a_sizes = a_sizes[valid]
+    b_sizes = b_sizes[valid]
+    
+    record_batch_player_stats(player_stats, a_names, a_sizes, b_names, b_sizes, team_a_wins[kept])
+    
+    # Map every player to a contiguous index with one unique pass and one bulk lookup (CSR layout)
+    player_names = pd.Index(pd.unique(np.concatenate([a_names, b_names])))
+    a_flat = player_names.get_indexer(a_names).astype(np.int64)
+    b_flat = player_names.get_indexer(b_names).astype(np.int64)
+    a_off = np.concatenate(([0], np.cumsum(a_sizes))).astype(np.int64)
+    b_off = np.concatenate(([0], np.cumsum(b_sizes))).astype(np.int64)
+    
+    # Sequential ELO replay in the compiled kernel
+    ratings = np.array([players.get(player, STARTING_RATING) for player in player_names], dtype=np.float64)
+    changes = _replay_elo(
+        a_flat, a_off, b_flat, b_off, team_a_wins[kept].astype(np.float64), ratings, _EXPECTED_LUT
+    )
+    
+    # Signed per-team changes for every match in one pass
+    rating_changes = np.rint(changes).astype(np.int64)
+    team_a_changes = np.where(team_a_wins[kept], rating_changes, -rating_changes)
+    
+    processed_matches = pd.DataFrame({
+        'Team_A': team_a_col[kept],
+        'Team_B': team_b_col[kept],
+        'Winner': winner_col[kept],
+        'Team_A_Rating_Change': team_a_changes,
+        'Team_B_Rating_Change': -team_a_changes,
+        'Team_A_Size': a_sizes,
+        'Team_B_Size': b_sizes
+    }).astype(MATCH_HISTORY_DTYPES)
+    
+    new_ratings = dict(zip(player_names, ratings.astype(np.int64).tolist()))
+    
+    return processed_matches, new_ratings, skipped
+
+def mark_data_changed():
+    """Give this session's ratings and history a new version token for the cached views"""
+    st.session_state.data_version = uuid.uuid4().hex
+
+@st.cache_data(max_entries=4)
+def build_standings(data_version, _ladder, _player_stats):
+    """
+    Build the standings table, cached per data_version
+    _ladder/_player_stats: not hashed, data_version identifies their contents
+    """
+    # Assemble the table column by column; the ladder is already in rank order
+    players = [player for _, player in _ladder]
+    ratings = np.fromiter((-neg_rating for neg_rating, _ in _ladder), dtype=np.int64, count=len(_ladder))
+    # Matches played and wins are kept up to date as matches are recorded
+    empty = {'matches': 0, 'wins': 0}
+    matches_played = np.fromiter((_player_stats.get(p, empty)['matches'] for p in players), dtype=np.int64, count=len(players))
+    wins = np.fromiter((_player_stats.get(p, empty)['wins'] for p in players), dtype=np.int64, count=len(players))
+    win_rate = np.divide(wins * 100, matches_played, out=np.zeros(len(players)), where=matches_played > 0)
+    
+    # Win rate stays numeric; the % formatting is applied by st.dataframe
+    return pd.DataFrame({
+        'Rank': np.arange(1, len(players) + 1),
+        'Player': players,
+        'ELO Rating': ratings,
+        'Matches': matches_played,
+        'Wins': wins,
+        'Win Rate %': win_rate.round(1).astype(np.float32)
+    })
+
+@st.cache_data(max_entries=4)
+def build_team_size_counts(data_version, _history):
+    """Count teams by number of players, cached per data_version"""
+    team_sizes = pd.concat([_history['Team_A_Size'], _history['Team_B_Size']], ignore_index=True)
+    return team_sizes.value_counts().sort_index()
+
+@st.cache_data(max_entries=4)
+def build_csv_download(data_version, name, _df):
+    """
+    Encode a table as CSV bytes for a download button, cached per data_version
+    name: which table is being exported, so each gets its own cache entry
+    """
+    return _df.to_csv(index=False).encode('utf-8')
+
+# Bulk upload format, built once at import instead of on every rerun
+REQUIRED_COLUMNS = ['Team_A', 'Team_B', 'Winner']
+UPLOAD_DTYPES = {col: 'string' for col in REQUIRED_COLUMNS}
+UPLOAD_LABEL = "Choose a CSV file with columns: Team_A, Team_B, Winner"
+UPLOAD_HELP = "Team_A and Team_B should contain comma-separated player names. Winner should be 'Team_A' or 'Team_B'"
+SAMPLE_CSV_DATA = pd.DataFrame({
+    'Team_A': ['Alice,Bob', 'Charlie,David,Eve', 'Alice,Frank'],
+    'Team_B': ['Charlie,David', 'Alice,Bob', 'Bob,Charlie,Eve'],
+    'Winner': ['Team_A', 'Team_B', 'Team_B']
+})
+CSV_FORMAT_NOTES = (
+    "- **Team_A/Team_B**: Comma-separated player names\n"
+    "- **Winner**: Either 'Team_A' or 'Team_B'\n"
+    "- Teams can have different numbers of players"
+)
+
+def read_match_csv(uploaded_file):
+    """
+    Read the match columns of an uploaded CSV as strings
+    Returns None if any of REQUIRED_COLUMNS is missing
+    """
+    # The multithreaded pyarrow parser is tried first
+    try:
+        return pd.read_csv(
+            uploaded_file,
+            engine='pyarrow',
+            dtype_backend='pyarrow',
+            usecols=REQUIRED_COLUMNS,
+            dtype=UPLOAD_DTYPES
+        )
+    except KeyError:
+        # pyarrow raises ArrowKeyError (a KeyError) when a usecols column is missing
+        return None
+    except (ImportError, ValueError):
+        # pyarrow rejects the whole file when a row has too few or too many fields (or is not
+        # installed); the C parser pads short rows with NA so they are skipped as invalid instead.
+        # ValueError covers both pandas' ParserError and the raw ArrowInvalid older pandas raise
+        uploaded_file.seek(0)
+    
+    df = pd.read_csv(
+        uploaded_file,
+        engine='c',
+        usecols=lambda col: col in REQUIRED_COLUMNS,
+        dtype=UPLOAD_DTYPES
+    )
+    if len(df.columns) < len(REQUIRED_COLUMNS):
+        return None
+    return df[REQUIRED_COLUMNS]
+
 # Initialize session state
+if 'match_history' not in st.session_state:
+    try:
+        history = load_match_history()
+    except Exception as e:
+        # Stop here rather than start empty, so the next save cannot overwrite the file
+        st.error(f"Could not read the saved match history ({MATCH_HISTORY_PATH}): {str(e)}")
+        st.stop()
+    st.session_state.match_history = history
+    
+    # Start from the saved snapshot when it matches the history, then replay only newer matches
+    st.session_state.players, st.session_state.player_stats = rebuild_from_history(history)
+elif isinstance(st.session_state.match_history, list):
+    # Sessions started before the upgrade still hold a list of match dicts
+    st.session_state.match_history = history_from_records(st.session_state.match_history)
 if 'players' not in st.session_state:
     st.session_state.players = {}
-if 'match_history' not in st.session_state:
-    st.session_state.match_history = []
+if 'player_stats' not in st.session_state:
+    st.session_state.player_stats = build_player_stats(st.session_state.match_history)
+if 'ladder' not in st.session_state:
+    st.session_state.ladder = sorted((-rating, player) for player, rating in st.session_state.players.items())
+if 'data_version' not in st.session_state:
+    mark_data_changed()
 if 'admin_authenticated' not in st.session_state:
     st.session_state.admin_authenticated = False
 
@@ -60,23 +563,23 @@ st.markdown("Track ELO ratings for team-based volleyball matches!")
 with st.sidebar:
     st.header("🏆 Current Ladder")
     if st.session_state.players:
-        # Sort players by ELO rating
-        sorted_players = sorted(st.session_state.players.items(), key=lambda x: x[1], reverse=True)
+        # The ladder is kept sorted by ELO rating as matches are recorded
+        ladder = st.session_state.ladder
         
         st.markdown("### Individual Rankings")
-        for i, (player, rating) in enumerate(sorted_players, 1):
-            if i <= 10:  # Show top 10 in sidebar
-                if i == 1:
-                    st.write(f"🥇 **{player}** - {rating}")
-                elif i == 2:
-                    st.write(f"🥈 **{player}** - {rating}")
-                elif i == 3:
-                    st.write(f"🥉 **{player}** - {rating}")
-                else:
-                    st.write(f"{i}. **{player}** - {rating}")
+        for i, (neg_rating, player) in enumerate(ladder[:10], 1):  # Show top 10 in sidebar
+            rating = -neg_rating
+            if i == 1:
+                st.write(f"🥇 **{player}** - {rating}")
+            elif i == 2:
+                st.write(f"🥈 **{player}** - {rating}")
+            elif i == 3:
+                st.write(f"🥉 **{player}** - {rating}")
+            else:
+                st.write(f"{i}. **{player}** - {rating}")
         
-        if len(sorted_players) > 10:
-            st.write(f"... and {len(sorted_players) - 10} more players")
+        if len(ladder) > 10:
+            st.write(f"... and {len(ladder) - 10} more players")
         
         # Show total matches played
         st.markdown("---")
@@ -93,48 +596,21 @@ with tab1:
     st.header("Current Standings")
     
     if st.session_state.players:
-        # Create a nice standings table
-        standings_data = []
-        sorted_players = sorted(st.session_state.players.items(), key=lambda x: x[1], reverse=True)
-        
-        for i, (player, rating) in enumerate(sorted_players, 1):
-            # Calculate matches played and win rate
-            player_matches = []
-            wins = 0
-            
-            for match in st.session_state.match_history:
-                team_a_players = parse_team_string(match['Team_A'])
-                team_b_players = parse_team_string(match['Team_B'])
-                
-                if player in team_a_players or player in team_b_players:
-                    player_matches.append(match)
-                    
-                    # Check if player was on winning team
-                    if ((player in team_a_players and match['Winner'] == 'Team_A') or 
-                        (player in team_b_players and match['Winner'] == 'Team_B')):
-                        wins += 1
-            
-            matches_played = len(player_matches)
-            win_rate = (wins / matches_played * 100) if matches_played > 0 else 0
-            
-            standings_data.append({
-                'Rank': i,
-                'Player': player,
-                'ELO Rating': rating,
-                'Matches': matches_played,
-                'Wins': wins,
-                'Win Rate %': f"{win_rate:.1f}%"
-            })
-        
-        standings_df = pd.DataFrame(standings_data)
-        st.dataframe(standings_df, use_container_width=True, hide_index=True)
+        # Create a nice standings table (rebuilt only when the data changes)
+        standings_df = build_standings(
+            st.session_state.data_version, st.session_state.ladder, st.session_state.player_stats
+        )
+        st.dataframe(
+            standings_df,
+            use_container_width=True,
+            hide_index=True,
+            column_config={'Win Rate %': st.column_config.NumberColumn(format="%.1f%%")}
+        )
         
         # Add download button for public standings
-        csv_buffer = io.StringIO()
-        standings_df.to_csv(csv_buffer, index=False)
         st.download_button(
             label="📥 Download Current Standings",
-            data=csv_buffer.getvalue(),
+            data=build_csv_download(st.session_state.data_version, 'standings', standings_df),
             file_name="volleyball_standings.csv",
             mime="text/csv"
         )
@@ -145,7 +621,7 @@ with tab1:
 with tab2:
     st.header("Match Statistics & History")
     
-    if st.session_state.match_history:
+    if len(st.session_state.match_history):
         col1, col2, col3 = st.columns(3)
         
         with col1:
@@ -153,20 +629,18 @@ with tab2:
         with col2:
             st.metric("Active Players", len(st.session_state.players))
         with col3:
-            if st.session_state.players:
-                highest_rated = max(st.session_state.players.items(), key=lambda x: x[1])
-                st.metric("Top Player", f"{highest_rated[0]} ({highest_rated[1]})")
+            if st.session_state.ladder:
+                # The ladder is already sorted, so the top player is its first entry
+                neg_rating, top_player = st.session_state.ladder[0]
+                st.metric("Top Player", f"{top_player} ({-neg_rating})")
         
         # Team composition analysis
         st.subheader("Team Size Distribution")
-        team_sizes = []
-        for match in st.session_state.match_history:
-            team_a_size = len(parse_team_string(match['Team_A']))
-            team_b_size = len(parse_team_string(match['Team_B']))
-            team_sizes.extend([team_a_size, team_b_size])
+        size_counts = build_team_size_counts(
+            st.session_state.data_version, st.session_state.match_history
+        )
         
-        if team_sizes:
-            size_counts = pd.Series(team_sizes).value_counts().sort_index()
+        if len(size_counts):
             col1, col2 = st.columns(2)
             with col1:
                 st.write("**Players per team:**")
@@ -175,30 +649,24 @@ with tab2:
         
         # Recent matches
         st.subheader("Recent Matches")
-        recent_matches = st.session_state.match_history[-10:]
+        recent_matches = st.session_state.match_history.tail(10).iloc[::-1]
         
-        for match in reversed(recent_matches):
-            with st.container():
-                st.markdown(f"**Match:** {match['Team_A']} vs {match['Team_B']}")
-                
-                col1, col2, col3 = st.columns([2, 1, 2])
-                with col1:
-                    st.write(f"**Team A:** {match['Team_A']}")
-                    if 'Team_A_Rating_Change' in match:
-                        change = match['Team_A_Rating_Change']
-                        st.write(f"Rating change: {change:+d}")
-                
-                with col2:
-                    winner_display = "Team A 🏐" if match['Winner'] == 'Team_A' else "Team B 🏐"
-                    st.write(f"**Winner:** {winner_display}")
-                
-                with col3:
-                    st.write(f"**Team B:** {match['Team_B']}")
-                    if 'Team_B_Rating_Change' in match:
-                        change = match['Team_B_Rating_Change']
-                        st.write(f"Rating change: {change:+d}")
-                
-                st.markdown("---")
+        # One table for all recent matches instead of a widget block per match
+        recent_df = pd.DataFrame({
+            'Match': (recent_matches['Team_A'] + ' vs ' + recent_matches['Team_B']).to_numpy(),
+            'Winner': np.where(recent_matches['Winner'] == 'Team_A', "Team A 🏐", "Team B 🏐"),
+            'Δ A': recent_matches['Team_A_Rating_Change'].to_numpy(),
+            'Δ B': recent_matches['Team_B_Rating_Change'].to_numpy()
+        })
+        st.dataframe(
+            recent_df,
+            use_container_width=True,
+            hide_index=True,
+            column_config={
+                'Δ A': st.column_config.NumberColumn(format="%+d"),
+                'Δ B': st.column_config.NumberColumn(format="%+d")
+            }
+        )
     else:
         st.info("No match history available yet.")
 
@@ -246,15 +714,18 @@ with tab3:
                     if len(team_a_players) == 0 or len(team_b_players) == 0:
                         st.error("Both teams must have at least one player")
                     else:
+                        # Work on a copy until the match is saved
+                        players, ladder, player_stats = session_working_copy()
+                        
                         # Initialize new players
                         all_players = team_a_players + team_b_players
-                        for player in all_players:
-                            if player not in st.session_state.players:
-                                st.session_state.players[player] = 1400
+                        set_player_ratings(
+                            players, ladder, {p: STARTING_RATING for p in all_players if p not in players}
+                        )
                         
                         # Get current ratings
-                        team_a_ratings = [st.session_state.players[p] for p in team_a_players]
-                        team_b_ratings = [st.session_state.players[p] for p in team_b_players]
+                        team_a_ratings = [players[p] for p in team_a_players]
+                        team_b_ratings = [players[p] for p in team_b_players]
                         
                         # Update ratings
                         team_a_wins = (winner == "Team A")
@@ -263,10 +734,10 @@ with tab3:
                         )
                         
                         # Apply new ratings
-                        for i, player in enumerate(team_a_players):
-                            st.session_state.players[player] = new_ratings_a[i]
-                        for i, player in enumerate(team_b_players):
-                            st.session_state.players[player] = new_ratings_b[i]
+                        new_ratings = dict(zip(team_a_players, new_ratings_a))
+                        new_ratings.update(zip(team_b_players, new_ratings_b))
+                        set_player_ratings(players, ladder, new_ratings)
+                        record_player_stats(player_stats, team_a_players, team_b_players, team_a_wins)
                         
                         # Record match
                         match_info = {
@@ -274,12 +745,19 @@ with tab3:
                             'Team_B': team_b,
                             'Winner': 'Team_A' if team_a_wins else 'Team_B',
                             'Team_A_Rating_Change': rating_change if team_a_wins else -rating_change,
-                            'Team_B_Rating_Change': -rating_change if team_a_wins else rating_change
+                            'Team_B_Rating_Change': -rating_change if team_a_wins else rating_change,
+                            'Team_A_Size': len(team_a_players),
+                            'Team_B_Size': len(team_b_players)
                         }
-                        st.session_state.match_history.append(match_info)
-                        
-                        st.success(f"Match added! Rating change: ±{abs(rating_change)}")
-                        st.rerun()
+                        try:
+                            store_new_matches(pd.DataFrame([match_info]), players, ladder, player_stats)
+                        except Exception as e:
+                            st.error(f"Could not save the match: {str(e)}")
+                        else:
+                            mark_data_changed()
+                            
+                            st.success(f"Match added! Rating change: ±{abs(rating_change)}")
+                            st.rerun()
                 else:
                     st.error("Please enter players for both teams")
         
@@ -288,34 +766,34 @@ with tab3:
         # File uploader (for bulk upload)
         st.subheader("Bulk Upload Match Results")
         
-        uploaded_file = st.file_uploader(
-            "Choose a CSV file with columns: Team_A, Team_B, Winner",
-            type="csv",
-            help="Team_A and Team_B should contain comma-separated player names. Winner should be 'Team_A' or 'Team_B'"
-        )
+        uploaded_file = st.file_uploader(UPLOAD_LABEL, type="csv", help=UPLOAD_HELP)
         
         # Show expected CSV format
         with st.expander("Expected CSV Format"):
-            sample_data = pd.DataFrame({
-                'Team_A': ['Alice,Bob', 'Charlie,David,Eve', 'Alice,Frank'],
-                'Team_B': ['Charlie,David', 'Alice,Bob', 'Bob,Charlie,Eve'],
-                'Winner': ['Team_A', 'Team_B', 'Team_B']
-            })
             st.write("Example CSV format:")
-            st.dataframe(sample_data)
-            st.write("- **Team_A/Team_B**: Comma-separated player names")
-            st.write("- **Winner**: Either 'Team_A' or 'Team_B'")
-            st.write("- Teams can have different numbers of players")
+            st.dataframe(SAMPLE_CSV_DATA)
+            st.markdown(CSV_FORMAT_NOTES)
+        
+        # Results of the last processed upload, kept in session state across the refresh
+        upload_report = st.session_state.pop('upload_report', None)
+        if upload_report is not None:
+            skipped, summary = upload_report
+            st.success(f"Processed {len(summary)} matches successfully!")
+            if len(skipped):
+                st.warning(f"Skipped {len(skipped)} matches")
+                st.dataframe(skipped, use_container_width=True, hide_index=True)
+            if len(summary):
+                st.subheader("Rating Changes Summary")
+                st.dataframe(summary, use_container_width=True, hide_index=True)
         
         if uploaded_file is not None:
             try:
-                # Read the CSV
-                df = pd.read_csv(uploaded_file)
+                # Read only the match columns, as strings
+                df = read_match_csv(uploaded_file)
                 
                 # Validate columns
-                required_columns = ['Team_A', 'Team_B', 'Winner']
-                if not all(col in df.columns for col in required_columns):
-                    st.error(f"CSV must contain columns: {required_columns}")
+                if df is None:
+                    st.error(f"CSV must contain columns: {REQUIRED_COLUMNS}")
                 else:
                     st.success(f"Loaded {len(df)} matches from CSV")
                     
@@ -325,68 +803,42 @@ with tab3:
                     
                     # Process matches button
                     if st.button("Process Matches and Update ELO"):
-                        processed_matches = []
+                        team_a_col = df['Team_A'].fillna('').str.strip().to_numpy()
+                        team_b_col = df['Team_B'].fillna('').str.strip().to_numpy()
+                        winner_col = df['Winner'].fillna('').str.strip().to_numpy()
                         
-                        for _, row in df.iterrows():
-                            team_a = str(row['Team_A']).strip()
-                            team_b = str(row['Team_B']).strip()
-                            winner = str(row['Winner']).strip()
-                            
-                            # Parse teams
-                            team_a_players = parse_team_string(team_a)
-                            team_b_players = parse_team_string(team_b)
-                            
-                            if len(team_a_players) == 0 or len(team_b_players) == 0:
-                                st.warning(f"Skipping match with empty team: {team_a} vs {team_b}")
-                                continue
-                            
-                            # Initialize new players (starting ELO: 1400)
-                            all_players = team_a_players + team_b_players
-                            for player in all_players:
-                                if player not in st.session_state.players:
-                                    st.session_state.players[player] = 1400
-                            
-                            # Get current ratings
-                            team_a_ratings = [st.session_state.players[p] for p in team_a_players]
-                            team_b_ratings = [st.session_state.players[p] for p in team_b_players]
-                            
-                            # Determine winner
-                            if winner not in ['Team_A', 'Team_B']:
-                                st.warning(f"Invalid winner '{winner}' for match {team_a} vs {team_b}. Skipping.")
-                                continue
-                            
-                            team_a_wins = (winner == 'Team_A')
-                            
-                            # Update ELO ratings
-                            new_ratings_a, new_ratings_b, rating_change = update_elo_ratings(
-                                team_a_ratings, team_b_ratings, team_a_wins
-                            )
-                            
-                            # Apply new ratings
-                            for i, player in enumerate(team_a_players):
-                                st.session_state.players[player] = new_ratings_a[i]
-                            for i, player in enumerate(team_b_players):
-                                st.session_state.players[player] = new_ratings_b[i]
-                            
-                            # Track match for history
-                            match_info = {
-                                'Team_A': team_a,
-                                'Team_B': team_b,
-                                'Winner': winner,
-                                'Team_A_Rating_Change': rating_change if team_a_wins else -rating_change,
-                                'Team_B_Rating_Change': -rating_change if team_a_wins else rating_change
-                            }
-                            processed_matches.append(match_info)
-                            st.session_state.match_history.append(match_info)
+                        # Validate all winners at once: values outside the categories get code -1
+                        winner_dtype = MATCH_HISTORY_DTYPES['Winner']
+                        winner_codes = winner_dtype.categories.get_indexer(winner_col)
+                        valid = winner_codes >= 0
+                        winner_cat = pd.Categorical.from_codes(winner_codes, dtype=winner_dtype)
+                        invalid_winners = pd.DataFrame({
+                            'Team_A': team_a_col[~valid],
+                            'Team_B': team_b_col[~valid],
+                            'Reason': "Invalid winner '" + pd.Series(winner_col[~valid], dtype=object) + "'"
+                        })
+                        
+                        # Work on a copy until the matches are saved
+                        players, ladder, player_stats = session_working_copy()
+                        new_matches, new_ratings, empty_skipped = replay_matches(
+                            team_a_col[valid], team_b_col[valid], winner_cat[valid], players, player_stats
+                        )
                         
-                        st.success(f"Processed {len(processed_matches)} matches successfully!")
+                        # Report all skipped rows together instead of one message per row
+                        skipped = pd.concat([invalid_winners, empty_skipped], ignore_index=True)
+                        set_player_ratings(players, ladder, new_ratings)
+                        store_new_matches(new_matches, players, ladder, player_stats)
+                        # Read the batch back from the history rather than holding a second copy
+                        history = st.session_state.match_history
+                        processed_matches = history.iloc[len(history) - len(new_matches):]
                         
-                        # Show summary of changes
-                        if processed_matches:
-                            st.subheader("Rating Changes Summary")
-                            for match in processed_matches:
-                                st.write(f"**{match['Team_A']}** vs **{match['Team_B']}** - Winner: {match['Winner']}")
-                                st.write(f"Rating change: ±{abs(match['Team_A_Rating_Change'])}")
+                        mark_data_changed()
+                        
+                        # Summary of changes as one table, shown with the skipped rows after the rerun
+                        summary = processed_matches[['Team_A', 'Team_B', 'Winner']].assign(
+                            **{'Rating Change': processed_matches['Team_A_Rating_Change'].abs()}
+                        )
+                        st.session_state.upload_report = (skipped, summary)
                         
                         # Refresh the app
                         st.rerun()
@@ -404,20 +856,26 @@ with tab3:
             if st.button("🗑️ Reset All Data", type="secondary"):
                 if st.checkbox("I understand this will delete all data"):
                     st.session_state.players = {}
-                    st.session_state.match_history = []
+                    with history_lock():
+                        for path in [MATCH_HISTORY_PATH, RATINGS_SNAPSHOT_PATH]:
+                            if os.path.exists(path):
+                                os.remove(path)
+                    st.session_state.match_history = load_match_history()
+                    st.session_state.player_stats = {}
+                    st.session_state.ladder = []
+                    mark_data_changed()
                     st.success("All data has been reset!")
                     st.rerun()
         
         with col2:
-            if st.session_state.match_history:
+            if len(st.session_state.match_history):
                 # Export match history
-                history_df = pd.DataFrame(st.session_state.match_history)
-                csv_buffer = io.StringIO()
-                history_df.to_csv(csv_buffer, index=False)
-                
                 st.download_button(
                     label="📥 Download Match History",
-                    data=csv_buffer.getvalue(),
+                    data=build_csv_download(
+                        st.session_state.data_version, 'match_history',
+                        st.session_state.match_history[MATCH_HISTORY_EXPORT_COLUMNS]
+                    ),
                     file_name="volleyball_match_history.csv",
                     mime="text/csv"
                 )